@@ -1,3 +1,7 @@
+import os
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -24,31 +28,100 @@ st.write(
 # 2. Cargar datos
 # ==========================
 
-@st.cache_data
-def load_data(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
-    df.columns = df.columns.str.strip()
-    return df
-
 # Cambia el nombre del archivo si es necesario
 FILE_PATH = "LIMITESANGLE.csv"
 
-df = load_data(FILE_PATH)
-
 # Ajusta estos nombres si tus columnas se llaman distinto
 col_base = "Base"
 col_var  = "Variable"
 col_lic  = "LIC"
 col_lsc  = "LSC"
 
+# Con más barras que esto se omiten las etiquetas de valor (render lento)
+MAX_BARRAS_TEXTO = 40
+# Con más puntos que esto las líneas se dibujan con WebGL (Scattergl)
+MAX_PUNTOS_SVG = 200
+# Con más puntos que esto las líneas se reducen con LTTB a lo más a este
+# número de puntos (la mitad elegida con LSC y la mitad con LIC)
+MAX_PUNTOS_LINEA = 1000
+# Máximo de filas que se envían al navegador en la tabla de datos filtrados
+MAX_FILAS_TABLA = 1000
+
+PARQUET_PATH = os.path.splitext(FILE_PATH)[0] + ".parquet"
+
+# Versión del procesamiento de load_data. add_derived no hashea su DataFrame
+# de entrada, así que súbela al cambiar load_data (dtypes, orden, columnas)
+# para invalidar también las columnas derivadas persistidas
+LOAD_VERSION = 1
+
+def csv_to_parquet(csv_path: str, parquet_path: str) -> bool:
+    # Convierte el CSV a Parquet si no existe o si el CSV cambió.
+    # El Parquet queda con el mismo mtime que el CSV del que salió, así que
+    # se compara con != (un CSV copiado con cp -p/rsync -a puede ser más viejo).
+    # Devuelve True si lo regeneró (el CSV cambió)
+    csv_stat = os.stat(csv_path)
+    if (
+        os.path.exists(parquet_path)
+        and os.stat(parquet_path).st_mtime_ns == csv_stat.st_mtime_ns
+    ):
+        return False
+    df = pd.read_csv(csv_path)
+    df.columns = df.columns.str.strip()
+    df.to_parquet(parquet_path, engine="pyarrow", index=False)
+    os.utime(parquet_path, ns=(csv_stat.st_atime_ns, csv_stat.st_mtime_ns))
+    return True
+
+# persist="disk": la caché (en ~/.streamlit/cache) sobrevive a reinicios del servidor
+@st.cache_data(persist="disk")
+def load_data(path: str, mtime: float) -> pd.DataFrame:
+    # `path` es el Parquet; `mtime` (del CSV) solo forma parte de la llave:
+    # si cambia el CSV se vuelve a cargar
+    # Columnas respaldadas por Arrow: los strings no pasan por objetos Python
+    df = pd.read_parquet(path, engine="pyarrow", dtype_backend="pyarrow")
+    # Base y Variable tienen pocos valores distintos: se guardan como category
+    # (astype ordena las categorías alfabéticamente)
+    for col in (col_base, col_var):
+        df[col] = df[col].astype("category")
+    # float32 basta para mostrar 2 decimales y reduce a la mitad la memoria.
+    # LIC/LSC quedan como NumPy (nulos -> NaN) porque los cálculos y Plotly
+    # trabajan sobre arreglos NumPy
+    for col in (col_lic, col_lsc):
+        df[col] = df[col].to_numpy(dtype="float32", na_value=np.nan)
+    # Ordenado una sola vez por Base y Variable: los groupby pueden usar
+    # sort=False y los grupos quedan contiguos
+    df = df.sort_values([col_base, col_var], kind="stable", ignore_index=True)
+    return df
+
+file_mtime = os.path.getmtime(FILE_PATH)
+csv_regenerado = csv_to_parquet(FILE_PATH, PARQUET_PATH)
+if csv_regenerado:
+    # CSV nuevo: las entradas persistidas de versiones anteriores ya no
+    # sirven, se borran para que ~/.streamlit/cache no crezca con cada edición
+    load_data.clear()
+df = load_data(PARQUET_PATH, file_mtime)
+
 st.write("Columnas detectadas:", list(df.columns))
 
 # ==========================
 # 3. Columnas derivadas
 # ==========================
 
-df["Rango"]  = df[col_lsc] - df[col_lic]
-df["Centro"] = (df[col_lsc] + df[col_lic]) / 2
+@st.cache_data(show_spinner=False, persist="disk")
+def add_derived(_df: pd.DataFrame, mtime: float, load_version: int) -> pd.DataFrame:
+    # Llave por mtime del CSV y LOAD_VERSION, sin hashear el DataFrame.
+    # Devuelve un DataFrame nuevo para no modificar el original cacheado.
+    # LIC/LSC se leen una sola vez como arreglos NumPy para ambas columnas.
+    lic = _df[col_lic].to_numpy()
+    lsc = _df[col_lsc].to_numpy()
+    return _df.assign(
+        Rango=lsc - lic,
+        Centro=(lsc + lic) * 0.5
+    )
+
+if csv_regenerado:
+    add_derived.clear()   # mismo motivo que load_data.clear()
+
+df = add_derived(df, file_mtime, LOAD_VERSION)
 
 # ==========================
 # 4. Filtros en la barra lateral
@@ -56,8 +129,14 @@ df["Centro"] = (df[col_lsc] + df[col_lic]) / 2
 
 st.sidebar.header("Filtros")
 
-bases_unicas = sorted(df[col_base].unique())
-vars_unicas  = sorted(df[col_var].unique())
+@st.cache_data(show_spinner=False)
+def unique_sorted(_df: pd.DataFrame, col: str, mtime: float) -> list:
+    # Las categorías ya vienen ordenadas al crearlas en load_data;
+    # la lista se cachea por columna y versión del archivo
+    return _df[col].cat.categories.tolist()
+
+bases_unicas = unique_sorted(df, col_base, file_mtime)
+vars_unicas  = unique_sorted(df, col_var, file_mtime)
 
 bases_sel = st.sidebar.multiselect(
     "Selecciona FVT/Base",
@@ -71,10 +150,34 @@ vars_sel = st.sidebar.multiselect(
     default=vars_unicas
 )
 
-df_filt = df[
-    df[col_base].isin(bases_sel) &
-    df[col_var].isin(vars_sel)
-].copy()
+def category_mask(serie: pd.Series, seleccion: tuple) -> np.ndarray:
+    # Tabla booleana por categoría indexada con los códigos enteros:
+    # evita hashear cada string como hace isin. El lugar extra al final
+    # queda en False y lo toman los códigos -1 (valores faltantes).
+    categorias = serie.cat.categories
+    keep = np.zeros(len(categorias) + 1, dtype=bool)
+    pos = categorias.get_indexer(list(seleccion))
+    keep[pos[pos >= 0]] = True
+    return keep[serie.cat.codes.to_numpy()]
+
+@st.cache_data(show_spinner=False)
+def filter_df(
+    _df: pd.DataFrame, mtime: float, bases: tuple, variables: tuple
+) -> pd.DataFrame:
+    # La llave es (mtime, selección): df no se hashea en cada rerun.
+    # Sin .copy(): el filtrado ya crea un DataFrame nuevo y no se escribe en él
+    mask = category_mask(_df[col_base], bases) & category_mask(_df[col_var], variables)
+    return _df.loc[mask]
+
+# Tuplas ordenadas: llave de caché estable sin importar el orden de selección
+bases_key = tuple(sorted(bases_sel))
+vars_key  = tuple(sorted(vars_sel))
+
+# Sin nada deseleccionado (estado inicial) no hace falta construir la máscara
+if len(bases_sel) == len(bases_unicas) and len(vars_sel) == len(vars_unicas):
+    df_filt = df
+else:
+    df_filt = filter_df(df, file_mtime, bases_key, vars_key)
 
 if df_filt.empty:
     st.warning("No hay datos para esta combinación de filtros. Ajusta la Base o Variable.")
@@ -85,16 +188,19 @@ if df_filt.empty:
 # 5. KPIs generales
 # ==========================
 
-# Seguimos calculando Rango porque lo usas en el resto del dashboard
-df_filt["Rango"] = df_filt[col_lsc] - df_filt[col_lic]
+# Posiciones de máximos/mínimos con NumPy (una pasada por columna)
+# y un solo .iloc para traer las cuatro filas
+lic_arr = df_filt[col_lic].to_numpy()
+lsc_arr = df_filt[col_lsc].to_numpy()
 
-# Límites inferiores (LIC)
-lic_max_row = df_filt.loc[df_filt[col_lic].idxmax()]
-lic_min_row = df_filt.loc[df_filt[col_lic].idxmin()]
+kpi_rows = df_filt.iloc[[
+    np.nanargmax(lic_arr), np.nanargmin(lic_arr),   # Límites inferiores (LIC)
+    np.nanargmax(lsc_arr), np.nanargmin(lsc_arr)    # Límites superiores (LSC)
+]]
 
-# Límites superiores (LSC)
-lsc_max_row = df_filt.loc[df_filt[col_lsc].idxmax()]
-lsc_min_row = df_filt.loc[df_filt[col_lsc].idxmin()]
+lic_max_row, lic_min_row, lsc_max_row, lsc_min_row = (
+    kpi_rows.iloc[i] for i in range(4)
+)
 
 c1, c2, c3, c4 = st.columns(4)
 
@@ -124,6 +230,194 @@ c4.metric(
 
 st.markdown("---")
 
+# ==========================
+# Agregaciones usadas por los tabs 2 y 3
+# ==========================
+
+class Agregados(NamedTuple):
+    df_vars: pd.DataFrame   # promedios LSC/LIC por Variable (tab 2)
+    df_heat: pd.DataFrame   # Rango promedio Base × Variable (tab 3)
+
+@st.cache_data(show_spinner=False)
+def aggregate(
+    _df_filt: pd.DataFrame, mtime: float, bases: tuple, variables: tuple
+) -> Agregados:
+    # df_filt queda determinado por el archivo (mtime) y la selección,
+    # así que esos valores son la llave y el DataFrame no se hashea
+    df_vars = (
+        _df_filt.groupby(col_var, sort=False, observed=True)[[col_lsc, col_lic]]
+        .mean()
+        .reset_index()
+        .sort_values(col_var)
+    )
+    # groupby + unstack en lugar de pivot_table: evita los intermedios
+    # grandes de pivot_table y, con observed=True, las combinaciones vacías
+    df_heat = (
+        _df_filt.groupby([col_base, col_var], sort=False, observed=True)["Rango"]
+        .mean()
+        .unstack(col_var)
+    )
+    return Agregados(df_vars, df_heat)
+
+df_vars, df_heat = aggregate(df_filt, file_mtime, bases_key, vars_key)
+
+# ==========================
+# Figuras cacheadas por selección
+# ==========================
+# Igual que en aggregate: la llave es (mtime, selección) y los DataFrames
+# de entrada se pasan sin hashear.
+# cache_resource devuelve la misma figura sin copiarla: con cache_data cada
+# acierto despickleaba la Figure, lo que revalida todo y cuesta más que
+# construirla de nuevo. st.plotly_chart no modifica la figura.
+
+@st.cache_resource(show_spinner=False)
+def build_fig_limits(
+    _df_base: pd.DataFrame, mtime: float, base: str, variables: tuple
+) -> go.Figure:
+    # Una traza por límite directamente sobre las columnas,
+    # sin pasar por un DataFrame en formato largo (melt)
+    texto_barras = "%{y:.2f}" if len(_df_base) <= MAX_BARRAS_TEXTO else None
+
+    fig = go.Figure()
+    fig.add_bar(
+        x=_df_base[col_var],
+        y=_df_base[col_lic],
+        name=col_lic,
+        marker_color="#4c78a8",   # azul para LIC
+        texttemplate=texto_barras
+    )
+    fig.add_bar(
+        x=_df_base[col_var],
+        y=_df_base[col_lsc],
+        name=col_lsc,
+        marker_color="#1f77b4",   # azul más intenso para LSC
+        texttemplate=texto_barras
+    )
+
+    fig.update_layout(
+        barmode="group",
+        title=f"Límites inferior (LIC) y superior (LSC) por Variable – {base}",
+        xaxis_title="Variable (pieza)",
+        yaxis_title="Valor del límite",
+        legend_title="Tipo de límite"
+    )
+    return fig
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets sobre las posiciones 0..n-1:
+    # conserva el primer y último punto y, en cada bucket intermedio, el
+    # punto que forma el triángulo de mayor área con el punto elegido
+    # antes y el promedio del bucket siguiente
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=np.float64)
+    bordes = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    bordes = np.append(bordes, n)   # el "bucket siguiente" del último es el punto final
+
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        sig_inicio, sig_fin = bordes[i + 1], bordes[i + 2]
+        x_prom = (sig_inicio + sig_fin - 1) / 2
+        y_sig = y[sig_inicio:sig_fin]
+        # Bucket siguiente todo NaN (promedios vacíos): se usa el punto anterior
+        y_prom = y[a] if np.isnan(y_sig).all() else np.nanmean(y_sig)
+
+        xs = np.arange(inicio, fin)
+        areas = np.abs((a - x_prom) * (y[inicio:fin] - y[a]) - (a - xs) * (y_prom - y[a]))
+        a = inicio + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+        idx[i + 1] = a
+    return idx
+
+@st.cache_resource(show_spinner=False)
+def build_fig_detalle(
+    _df_vars: pd.DataFrame, mtime: float, bases: tuple, variables: tuple
+) -> go.Figure:
+    # Muchas Variables: se grafican solo los puntos que LTTB elige para LSC
+    # o para LIC (la unión, para que ambas trazas compartan el eje x).
+    # Cada serie aporta la mitad del tope para que la unión no lo rebase
+    if len(_df_vars) > MAX_PUNTOS_LINEA:
+        n_serie = MAX_PUNTOS_LINEA // 2
+        idx = np.union1d(
+            lttb_indices(_df_vars[col_lsc].to_numpy(), n_serie),
+            lttb_indices(_df_vars[col_lic].to_numpy(), n_serie)
+        )
+        _df_vars = _df_vars.iloc[idx]
+
+    Trace = go.Scattergl if len(_df_vars) > MAX_PUNTOS_SVG else go.Scatter
+
+    fig = go.Figure()
+    fig.add_trace(Trace(
+        x=_df_vars[col_var],
+        y=_df_vars[col_lsc],
+        mode="lines+markers",
+        name="LSC (promedio)",
+        line=dict(color="#1f77b4")
+    ))
+    fig.add_trace(Trace(
+        x=_df_vars[col_var],
+        y=_df_vars[col_lic],
+        mode="lines+markers",
+        name="LIC (promedio)",
+        line=dict(color="#0d3b66")
+    ))
+    fig.update_layout(
+        title="Límites promedio LSC vs LIC por Variable (todas las Bases filtradas)",
+        xaxis_title="Variable (pieza)",
+        yaxis_title="Valor",
+        legend_title="Límite"
+    )
+    return fig
+
+@st.cache_resource(show_spinner=False)
+def build_fig_bar_promedio(
+    _df_vars: pd.DataFrame, mtime: float, bases: tuple, variables: tuple,
+    col: str, title: str, color: str
+) -> go.Figure:
+    texto_barras = ".2f" if len(_df_vars) <= MAX_BARRAS_TEXTO else False
+
+    fig = px.bar(
+        _df_vars,
+        x=col_var,
+        y=col,
+        title=title,
+        text_auto=texto_barras,
+        color_discrete_sequence=[color]
+    )
+    fig.update_layout(
+        xaxis_title="Variable (pieza)",
+        yaxis_title=f"{col} promedio"
+    )
+    return fig
+
+@st.cache_resource(show_spinner=False)
+def build_fig_heat(
+    _df_heat: pd.DataFrame, mtime: float, bases: tuple, variables: tuple
+) -> go.Figure:
+    # Matriz float32 C-contigua: el resultado de unstack puede quedar en
+    # orden F y así se serializa como un solo bloque de memoria
+    z = np.ascontiguousarray(_df_heat.to_numpy(dtype=np.float32))
+
+    # go.Heatmap directo con la matriz ya calculada (sin la inferencia de px.imshow)
+    fig = go.Figure(go.Heatmap(
+        z=z,
+        x=_df_heat.columns.tolist(),
+        y=_df_heat.index.tolist(),
+        colorscale="Blues",
+        colorbar=dict(title="Rango"),
+        hovertemplate=f"{col_var}: %{{x}}<br>{col_base}: %{{y}}<br>Rango: %{{z:.2f}}<extra></extra>"
+    ))
+    fig.update_layout(
+        title="Heatmap del rango (LSC − LIC) por FVT/Base y Variable",
+        xaxis_title=col_var,
+        yaxis_title=col_base
+    )
+    return fig
+
 # ==========================
 # 6. Tabs para organizar las gráficas
 #    Orden nuevo:
@@ -149,40 +443,15 @@ with tab1:
         base_seleccionada = bases_sel[0]
         st.write(f"Base seleccionada: **{base_seleccionada}**")
 
-        df_base = df_filt[df_filt[col_base] == base_seleccionada].copy()
+        df_base = df_filt[df_filt[col_base] == base_seleccionada]
 
         if df_base.empty:
             st.warning("No hay datos para esta base con las variables seleccionadas.")
         else:
-            # Reorganizar en formato largo para tener LIC y LSC como categorías
-            df_melt = df_base.melt(
-                id_vars=[col_var],
-                value_vars=[col_lic, col_lsc],
-                var_name="Tipo_Límite",
-                value_name="Valor"
+            fig_bar_limits = build_fig_limits(
+                df_base, file_mtime, base_seleccionada, vars_key
             )
-
-            fig_bar_limits = px.bar(
-                df_melt,
-                x=col_var,
-                y="Valor",
-                color="Tipo_Límite",
-                barmode="group",
-                title=f"Límites inferior (LIC) y superior (LSC) por Variable – {base_seleccionada}",
-                color_discrete_map={
-                    col_lic: "#4c78a8",   # azul para LIC
-                    col_lsc: "#1f77b4"    # azul más intenso para LSC
-                },
-                text_auto=True
-            )
-
-            fig_bar_limits.update_layout(
-                xaxis_title="Variable (pieza)",
-                yaxis_title="Valor del límite",
-                legend_title="Tipo de límite"
-            )
-
-            st.plotly_chart(fig_bar_limits, use_container_width=True)
+            st.plotly_chart(fig_bar_limits, width="stretch")
     else:
         st.info(
             "Para ver esta gráfica, selecciona **exactamente una** Base/FVT en la barra lateral."
@@ -195,76 +464,37 @@ with tab1:
 with tab2:
     st.subheader("Comparación promedio LSC vs LIC por Variable")
 
-    df_vars = (
-        df_filt.groupby(col_var)[[col_lsc, col_lic]]
-        .mean()
-        .reset_index()
-        .sort_values(col_var)
-    )
-
     # --- Gráfica de líneas LSC vs LIC promedio ---
-    fig_detalle = go.Figure()
-    fig_detalle.add_trace(go.Scatter(
-        x=df_vars[col_var],
-        y=df_vars[col_lsc],
-        mode="lines+markers",
-        name="LSC (promedio)",
-        line=dict(color="#1f77b4")
-    ))
-    fig_detalle.add_trace(go.Scatter(
-        x=df_vars[col_var],
-        y=df_vars[col_lic],
-        mode="lines+markers",
-        name="LIC (promedio)",
-        line=dict(color="#0d3b66")
-    ))
-    fig_detalle.update_layout(
-        title="Límites promedio LSC vs LIC por Variable (todas las Bases filtradas)",
-        xaxis_title="Variable (pieza)",
-        yaxis_title="Valor",
-        legend_title="Límite"
-    )
+    fig_detalle = build_fig_detalle(df_vars, file_mtime, bases_key, vars_key)
 
-    st.plotly_chart(fig_detalle, use_container_width=True)
+    st.plotly_chart(fig_detalle, width="stretch")
 
     st.markdown("### Barras individuales de límites promedio por Variable")
 
     # --- Gráfica de barras solo LIC promedio ---
-    fig_lic_bar = px.bar(
-        df_vars,
-        x=col_var,
-        y=col_lic,
-        title="Límite inferior (LIC) promedio por Variable",
-        text_auto=True,
-        color_discrete_sequence=["#4c78a8"]
-    )
-    fig_lic_bar.update_layout(
-        xaxis_title="Variable (pieza)",
-        yaxis_title="LIC promedio"
+    fig_lic_bar = build_fig_bar_promedio(
+        df_vars, file_mtime, bases_key, vars_key,
+        col_lic, "Límite inferior (LIC) promedio por Variable", "#4c78a8"
     )
 
     # --- Gráfica de barras solo LSC promedio ---
-    fig_lsc_bar = px.bar(
-        df_vars,
-        x=col_var,
-        y=col_lsc,
-        title="Límite superior (LSC) promedio por Variable",
-        text_auto=True,
-        color_discrete_sequence=["#1f77b4"]
-    )
-    fig_lsc_bar.update_layout(
-        xaxis_title="Variable (pieza)",
-        yaxis_title="LSC promedio"
+    fig_lsc_bar = build_fig_bar_promedio(
+        df_vars, file_mtime, bases_key, vars_key,
+        col_lsc, "Límite superior (LSC) promedio por Variable", "#1f77b4"
     )
 
     c_bar1, c_bar2 = st.columns(2)
     with c_bar1:
-        st.plotly_chart(fig_lic_bar, use_container_width=True)
+        st.plotly_chart(fig_lic_bar, width="stretch")
     with c_bar2:
-        st.plotly_chart(fig_lsc_bar, use_container_width=True)
+        st.plotly_chart(fig_lsc_bar, width="stretch")
 
     st.markdown("### Datos filtrados")
-    st.dataframe(df_filt[[col_base, col_var, col_lic, col_lsc, "Rango", "Centro"]])
+    st.dataframe(
+        df_filt[[col_base, col_var, col_lic, col_lsc, "Rango", "Centro"]].head(MAX_FILAS_TABLA),
+        width="stretch"
+    )
+    st.caption(f"Mostrando {min(len(df_filt), MAX_FILAS_TABLA)} de {len(df_filt)} filas")
 
 # ==========================
 # Tab 3: Heatmap FVT × Variable del rango
@@ -273,20 +503,6 @@ with tab2:
 with tab3:
     st.subheader("Mapa de calor del rango (LSC − LIC) por FVT/Base y Variable")
 
-    df_heat = df_filt.pivot_table(
-        index=col_base,
-        columns=col_var,
-        values="Rango",
-        aggfunc="mean"
-    )
-
-    fig_heat = px.imshow(
-        df_heat,
-        color_continuous_scale="Blues",
-        aspect="auto",
-        origin="lower",
-        labels=dict(color="Rango"),
-        title="Heatmap del rango (LSC − LIC) por FVT/Base y Variable"
-    )
+    fig_heat = build_fig_heat(df_heat, file_mtime, bases_key, vars_key)
 
-    st.plotly_chart(fig_heat, use_container_width=True)
+    st.plotly_chart(fig_heat, width="stretch")